@@ -12,8 +12,7 @@ def index():
 
 @app.route('/user/<user_id>/profile')
 def user_profile(user_id):
-    user_profile = profiling_service.get_user_profile(user_id)
-    contributions = profiling_service.analyze_profile_contribution(user_id)
+    user_profile, contributions = profiling_service.get_user_profile_with_contributions(user_id)
     
     return render_template('profile.html',
                          user_profile=user_profile,
@@ -89,11 +89,10 @@ def run_demo(user_id="23759"):
     recommendation_service = RecommendationService()
     
     print("1. Generating user profile...")
-    user_profile = profiling_service.get_user_profile(user_id)
+    user_profile, contributions = profiling_service.get_user_profile_with_contributions(user_id)
     print_user_profile(user_profile)
     
     print("2. Analyzing user profile contribution by event type...")
-    contributions = profiling_service.analyze_profile_contribution(user_id)
     print("\nEvent contribution analysis:")
     for event_type, data in contributions.items():
         print(f"\n{event_type.upper()} (count: {data['count']}):")
@@ -2,6 +2,7 @@ import json
 import datetime
 from collections import defaultdict, Counter
 import math
+import sys
 from typing import Dict, List, Tuple, Any, Optional
 
 ##############################################
@@ -190,13 +191,13 @@ class EventProcessor:
         """Extract individual categories from comma-separated string"""
         if not categories_str or categories_str == "Unknown":
             return []
-        return [cat.strip() for cat in categories_str.split(",")]
+        return [sys.intern(cat.strip()) for cat in categories_str.split(",")]
     
     def extract_grades(self, grades_str: str) -> List[str]:
         """Extract individual grade levels from comma-separated string"""
         if not grades_str or grades_str == "Unknown":
             return []
-        return [grade.strip() for grade in grades_str.split(",")]
+        return [sys.intern(grade.strip()) for grade in grades_str.split(",")]
     
     def get_event_time(self, event: Dict) -> str:
         """Extract time from an event with fallbacks"""
@@ -261,6 +262,17 @@ class SearchAnalyzer:
     def __init__(self, materials: Dict[str, Dict], event_processor: EventProcessor):
         self.materials = materials
         self.event_processor = event_processor
+        
+        # Precompute (name, lowercase name) pairs per material once, instead of
+        # re-splitting every material's category/grade strings for each search.
+        # Names are interned by the extractors, which keeps Counter keys cheap.
+        self._material_terms = [
+            (
+                [(cat, cat.lower()) for cat in event_processor.extract_categories(material.get("categories", ""))],
+                [(grade, grade.lower()) for grade in event_processor.extract_grades(material.get("class_grades", ""))]
+            )
+            for material in materials.values()
+        ]
     
     def extract_search_insights(self, searches: List[Dict], weight: float) -> Tuple[Counter, Counter]:
         """Extract category and grade insights from search queries"""
@@ -279,15 +291,14 @@ class SearchAnalyzer:
             
             # Try to extract subject information from the search query
             # This is a simple approach - in a real system you'd want more sophisticated NLP
-            for material in self.materials.values():
-                categories = self.event_processor.extract_categories(material.get("categories", ""))
-                for category in categories:
-                    if category.lower() in query:
+            for categories, grades in self._material_terms:
+                for category, category_lower in categories:
+                    if category_lower in query:
                         categories_counter[category] += weighted_score
                 
                 # Try to match grade levels in search query
-                for grade in self.event_processor.extract_grades(material.get("class_grades", "")):
-                    if grade.lower() in query:
+                for grade, grade_lower in grades:
+                    if grade_lower in query:
                         grades_counter[grade] += weighted_score * 0.5  # Lower weight since no direct correlation
         
         return categories_counter, grades_counter
@@ -357,8 +368,27 @@ class UserProfiler:
         
         return categories_counter, grades_counter
     
-    def create_user_profile(self, user_id: str) -> Dict[str, Any]:
-        """Create a comprehensive profile for a user considering all events with appropriate weighting"""
+    def create_user_profile(
+        self,
+        user_id: str,
+        generation_time: Optional[str] = None,
+        return_contributions: bool = False
+    ) -> Any:
+        """
+        Create a comprehensive profile for a user considering all events with appropriate weighting.
+        When return_contributions is True, a (profile, event_contributions) tuple is returned instead.
+        """
+        profile, event_contributions = self._build_profile(user_id, generation_time)
+        if return_contributions:
+            return profile, event_contributions
+        return profile
+    
+    def _build_profile(
+        self, 
+        user_id: str, 
+        generation_time: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        """Aggregate all user events into a profile and per-event-type contributions"""
         # Get all user events
         user_events = self.repository.get_user_events(user_id)
         materials = self.repository.get_materials()
@@ -369,6 +399,7 @@ class UserProfiler:
         # Initialize counters for aggregation
         all_categories = Counter()
         all_grades = Counter()
+        event_contributions = {}
         
         # Log event counts for transparency
         event_counts = {k: len(v) for k, v in user_events.items()}
@@ -392,6 +423,15 @@ class UserProfiler:
                     materials
                 )
             
+            # Record top contributions from this event type
+            event_contributions[event_type] = {
+                "count": len(events),
+                "top_categories": [cat for cat, _ in cat_counter.most_common(3)],
+                "top_grades": [grade for grade, _ in grade_counter.most_common(3)],
+                "grade_weight": self.event_processor.get_event_weight(event_type, True),
+                "subject_weight": self.event_processor.get_event_weight(event_type, False)
+            }
+            
             # Aggregate counters
             all_categories.update(cat_counter)
             all_grades.update(grade_counter)
@@ -402,7 +442,7 @@ class UserProfiler:
         )
         
         # Determine top price preference
-        top_price = max(price_preferences.items(), key=lambda x: x[1])[0] if price_preferences else "medium"
+        top_price = max(price_preferences, key=price_preferences.get, default="medium")
         
         # Create the profile
         profile = {
@@ -414,10 +454,10 @@ class UserProfiler:
             "grade_weights": dict(all_grades),
             "price_range_weights": price_preferences,
             "event_counts": event_counts,
-            "profile_generation_time": datetime.datetime.now().isoformat()
+            "profile_generation_time": generation_time or datetime.datetime.now().isoformat()
         }
         
-        return profile
+        return profile, event_contributions
 
 
 ##############################################
@@ -436,8 +476,11 @@ class PersonalizationService:
         top_users = self.repository.get_top_users_by_gmv(top_n)
         profiles = {}
         
+        # Snapshot the generation time once for the whole batch
+        generation_time = datetime.datetime.now().isoformat()
+        
         for user_id in top_users:
-            profiles[user_id] = self.profiler.create_user_profile(user_id)
+            profiles[user_id] = self.profiler.create_user_profile(user_id, generation_time)
         
         return profiles
     
@@ -445,44 +488,20 @@ class PersonalizationService:
         """Get profile for a specific user"""
         return self.profiler.create_user_profile(user_id)
     
+    def get_user_profile_with_contributions(self, user_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Get a user's profile and its per-event-type contributions from a single aggregation pass"""
+        return self.profiler.create_user_profile(user_id, return_contributions=True)
+    
     def get_user_behavior(self, user_id: str) -> Dict[str, List[Dict]]:
         """Get all recorded behaviors for a specific user"""
         return self.repository.get_user_events(user_id)
     
     def analyze_profile_contribution(self, user_id: str) -> Dict[str, Any]:
         """Analyze how different event types contribute to a user's profile"""
-        user_events = self.repository.get_user_events(user_id)
-        materials = self.repository.get_materials()
-        reference_time = self.profiler.get_reference_time(user_events)
-        
-        event_contributions = {}
-        
-        # Analyze each event type separately
-        for event_type in self.profiler.event_processor.event_priority_order:
-            events = user_events.get(event_type, [])
-            
-            if event_type == "searches":
-                cat_counter, grade_counter = self.profiler.search_analyzer.extract_search_insights(
-                    events, 
-                    self.profiler.event_processor.get_event_weight(event_type, False)
-                )
-            else:
-                cat_counter, grade_counter = self.profiler.process_material_based_events(
-                    events, 
-                    event_type, 
-                    reference_time,
-                    materials
-                )
-            
-            # Record top contributions from this event type
-            event_contributions[event_type] = {
-                "count": len(events),
-                "top_categories": [cat for cat, _ in cat_counter.most_common(3)],
-                "top_grades": [grade for grade, _ in grade_counter.most_common(3)],
-                "grade_weight": self.profiler.event_processor.get_event_weight(event_type, True),
-                "subject_weight": self.profiler.event_processor.get_event_weight(event_type, False)
-            }
-        
+        _, event_contributions = self.profiler.create_user_profile(
+            user_id, 
+            return_contributions=True
+        )
         return event_contributions
 
 
@@ -498,7 +517,7 @@ def main():
     print(f"Generated profiles for {len(top_profiles)} users")
     
     # Example: Get profile for a specific user
-    user_profile = service.get_user_profile("23759")
+    user_profile, contributions = service.get_user_profile_with_contributions("23759")
     print(f"\nProfile for user 23759:")
     print(f"Preferred categories: {user_profile['preferred_categories']}")
     print(f"Preferred grades: {user_profile['preferred_grades']}")
@@ -510,8 +529,7 @@ def main():
     for event_type, events in user_behavior.items():
         print(f"{event_type}: {len(events)} events")
     
-    # Analyze how different events contribute to the profile
-    contributions = service.analyze_profile_contribution("23759")
+    # Show how different events contribute to the profile (computed with the profile above)
     print("\nEvent contribution analysis:")
     for event_type, data in contributions.items():
         print(f"\n{event_type.upper()} (count: {data['count']}):")
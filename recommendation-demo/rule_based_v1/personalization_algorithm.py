@@ -1,9 +1,18 @@
+import glob
+import hashlib
 import json
 import os
-from datetime import datetime
-from collections import Counter, defaultdict
+import pickle
+from collections import Counter, OrderedDict, defaultdict
+from itertools import chain, islice, repeat
+from operator import itemgetter
 from typing import Dict, List, Tuple, Set, Any
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library parser
+    orjson = None
+
 class DataLoader:
     """
     Component responsible for loading and preprocessing the data.
@@ -21,23 +30,20 @@ class DataLoader:
         Load all data files from the specified path.
         """
         # Load materials
-        with open(os.path.join(self.data_path, "materials.json"), "r") as f:
-            materials_data = json.load(f)
-            # Index materials by ID for faster lookup
-            self.materials = {str(item["material_id"]): item for item in materials_data}
+        materials_data = self._load_json("materials.json")
+        # Convert numeric fields and the ID string once, so later rules don't re-parse them
+        for item in materials_data:
+            item["price"] = float(item["price"])
+            item["bestseller_rating"] = float(item["bestseller_rating"])
+            item["_id_str"] = str(item["material_id"])
+        # Index materials by ID for faster lookup
+        self.materials = {item["_id_str"]: item for item in materials_data}
         
         # Load user behavior data
-        with open(os.path.join(self.data_path, "purchases.json"), "r") as f:
-            self.purchases = json.load(f)
-        
-        with open(os.path.join(self.data_path, "favorites.json"), "r") as f:
-            self.favorites = json.load(f)
-        
-        with open(os.path.join(self.data_path, "interactions.json"), "r") as f:
-            self.interactions = json.load(f)
-        
-        with open(os.path.join(self.data_path, "searches.json"), "r") as f:
-            self.searches = json.load(f)
+        self.purchases = self._load_json("purchases.json")
+        self.favorites = self._load_json("favorites.json")
+        self.interactions = self._load_json("interactions.json")
+        self.searches = self._load_json("searches.json")
         
         print(f"Loaded {len(self.materials)} materials")
         print(f"Loaded {len(self.purchases)} purchases")
@@ -46,6 +52,17 @@ class DataLoader:
         print(f"Loaded {len(self.searches)} searches")
         
         return self
+    
+    def _load_json(self, file_name):
+        """
+        Parse a JSON file from the data path, using orjson when it is installed.
+        """
+        path = os.path.join(self.data_path, file_name)
+        if orjson is not None:
+            with open(path, "rb") as f:
+                return orjson.loads(f.read())
+        with open(path, "r") as f:
+            return json.load(f)
 
 
 class UserProfileBuilder:
@@ -55,6 +72,19 @@ class UserProfileBuilder:
     def __init__(self, data_loader):
         self.data_loader = data_loader
         self.user_profiles = {}
+        
+        # Preference weight of each signal type
+        self.signal_weights = {
+            "purchase": 1,
+            "favorite": 0.5,        # Lower weight than purchases
+            "other_interaction": 0.2
+        }
+        # Preference weight of each interaction type; any other type uses "other_interaction"
+        self.interaction_weights = {
+            "click": 0.3,
+            "view_preview": 0.4,
+            "add_to_cart": 0.5
+        }
     
     def build_profiles(self):
         """
@@ -63,11 +93,8 @@ class UserProfileBuilder:
         # Initialize user profiles
         self._initialize_user_profiles()
         
-        # Process different types of signals
-        self._process_purchases()
-        self._process_favorites()
-        self._process_interactions()
-        self._process_searches()
+        # Process all types of signals in a single pass
+        self._process_signals()
         
         # Infer preferences based on behaviors
         self._infer_preferences()
@@ -78,32 +105,15 @@ class UserProfileBuilder:
         """
         Initialize user profiles with empty structures.
         """
-        # Get all unique user IDs from all data sources
+        # Get all unique user IDs from all data sources in a single pass
         user_ids = set()
-        for purchase in self.data_loader.purchases:
-            try:
-                user_ids.add(purchase["user_id"])
-            except KeyError:
-                print(f"Warning: Found search record without user_id field: {search}")
-                continue
-        for favorite in self.data_loader.favorites:
-            try:
-                user_ids.add(favorite["user_id"])
-            except KeyError:
-                print(f"Warning: Found search record without user_id field: {search}")
-                continue
-        for interaction in self.data_loader.interactions:
-            try:
-                user_ids.add(interaction["user_id"])
-            except KeyError:
-                print(f"Warning: Found search record without user_id field: {search}")
-                continue
-        for search in self.data_loader.searches:
-            try:
-                user_ids.add(search["user_id"])
-            except KeyError:
-                print(f"Warning: Found search record without user_id field: {search}")
+        for record in chain(self.data_loader.purchases, self.data_loader.favorites,
+                            self.data_loader.interactions, self.data_loader.searches):
+            user_id = record.get("user_id")
+            if user_id is None:
+                print(f"Warning: Found record without user_id field: {record}")
                 continue
+            user_ids.add(user_id)
         
         # Initialize empty profiles
         for user_id in user_ids:
@@ -115,11 +125,12 @@ class UserProfileBuilder:
                     "interactions": [],
                     "searches": []
                 },
+                # Weighted scores accumulated from behavior signals
                 "preferences": {
-                    "categories": Counter(),
-                    "grade_levels": Counter(),
-                    "price_ranges": Counter(),
-                    "is_bundle": Counter()
+                    "categories": defaultdict(float),
+                    "grade_levels": defaultdict(float),
+                    "price_ranges": defaultdict(float),
+                    "is_bundle": defaultdict(float)
                 },
                 "context": {
                     "device": None
@@ -131,124 +142,80 @@ class UserProfileBuilder:
                 }
             }
     
-    def _process_purchases(self):
-        """
-        Process purchase data to enrich user profiles.
-        """
-        for purchase in self.data_loader.purchases:
-            user_id = purchase["user_id"]
-            if user_id in self.user_profiles:
-                # Add to behavior
-                self.user_profiles[user_id]["behavior"]["purchases"].append(purchase)
-                
-                # Update preferences counters
-                self.user_profiles[user_id]["preferences"]["categories"][purchase["material_category"]] += 1
-                self.user_profiles[user_id]["preferences"]["grade_levels"][purchase["class_grade"]] += 1
-                
-                # Categorize price ranges
-                price = float(purchase["purchase_price"])
-                price_range = self._get_price_range(price)
-                self.user_profiles[user_id]["preferences"]["price_ranges"][price_range] += 1
-                
-                # Bundle preference
-                is_bundle = "1" if purchase["is_bundle"] == "1" else "0"
-                self.user_profiles[user_id]["preferences"]["is_bundle"][is_bundle] += 1
-                
-                # Update context
-                self.user_profiles[user_id]["context"]["device"] = purchase["user_device"]
-                
-                # Update recent activity
-                purchase_date = datetime.strptime(purchase["date"], "%Y-%m-%d")
-                if (self.user_profiles[user_id]["recent_activity"]["last_active_date"] is None or
-                    purchase_date > datetime.strptime(self.user_profiles[user_id]["recent_activity"]["last_active_date"], "%Y-%m-%d")):
-                    self.user_profiles[user_id]["recent_activity"]["last_active_date"] = purchase["date"]
-                    self.user_profiles[user_id]["recent_activity"]["last_purchased_material"] = purchase["material_id"]
-    
-    def _process_favorites(self):
-        """
-        Process favorites data to enrich user profiles.
-        """
-        for favorite in self.data_loader.favorites:
-            user_id = favorite["user_id"]
-            if user_id in self.user_profiles:
-                # Add to behavior
-                self.user_profiles[user_id]["behavior"]["favorites"].append(favorite)
-                
-                # Update preferences counters
-                self.user_profiles[user_id]["preferences"]["categories"][favorite["material_category"]] += 0.5  # Lower weight than purchases
-                self.user_profiles[user_id]["preferences"]["grade_levels"][favorite["class_grade"]] += 0.5
-                
-                # Categorize price ranges
-                price = float(favorite["material_price"])
-                price_range = self._get_price_range(price)
-                self.user_profiles[user_id]["preferences"]["price_ranges"][price_range] += 0.5
-                
-                # Bundle preference
-                is_bundle = "1" if favorite["is_bundle"] == "1" else "0"
-                self.user_profiles[user_id]["preferences"]["is_bundle"][is_bundle] += 0.5
-                
-                # Update context
-                self.user_profiles[user_id]["context"]["device"] = favorite["user_device"]
-                
-                # Update recent activity
-                favorite_date = datetime.strptime(favorite["date"], "%Y-%m-%d")
-                if (self.user_profiles[user_id]["recent_activity"]["last_active_date"] is None or
-                    favorite_date > datetime.strptime(self.user_profiles[user_id]["recent_activity"]["last_active_date"], "%Y-%m-%d")):
-                    self.user_profiles[user_id]["recent_activity"]["last_active_date"] = favorite["date"]
-    
-    def _process_interactions(self):
-        """
-        Process interaction data to enrich user profiles.
-        """
-        for interaction in self.data_loader.interactions:
-            user_id = interaction["user_id"]
-            if user_id in self.user_profiles:
-                # Add to behavior
-                self.user_profiles[user_id]["behavior"]["interactions"].append(interaction)
-                
-                # Update preferences counters with smaller weights
-                weight = 0.3 if interaction["type"] == "click" else 0.4 if interaction["type"] == "view_preview" else 0.5 if interaction["type"] == "add_to_cart" else 0.2
-                
-                self.user_profiles[user_id]["preferences"]["categories"][interaction["material_category"]] += weight
-                self.user_profiles[user_id]["preferences"]["grade_levels"][interaction["class_grade"]] += weight
-                
-                # Categorize price ranges
-                price = float(interaction["material_price"])
-                price_range = self._get_price_range(price)
-                self.user_profiles[user_id]["preferences"]["price_ranges"][price_range] += weight
-                
-                # Bundle preference
-                is_bundle = "1" if interaction["is_bundle"] == "1" else "0"
-                self.user_profiles[user_id]["preferences"]["is_bundle"][is_bundle] += weight
-                
-                # Update context
-                self.user_profiles[user_id]["context"]["device"] = interaction["user_device"]
-                
-                # Update recent activity
-                interaction_date = datetime.strptime(interaction["date"], "%Y-%m-%d")
-                if (self.user_profiles[user_id]["recent_activity"]["last_active_date"] is None or
-                    interaction_date > datetime.strptime(self.user_profiles[user_id]["recent_activity"]["last_active_date"], "%Y-%m-%d")):
-                    self.user_profiles[user_id]["recent_activity"]["last_active_date"] = interaction["date"]
-    
-    def _process_searches(self):
-        """
-        Process search data to enrich user profiles.
-        """
-        for search in self.data_loader.searches:
-            user_id = search["user_id"]
-            if user_id in self.user_profiles:
-                # Add to behavior
-                self.user_profiles[user_id]["behavior"]["searches"].append(search)
-                
-                # Update context
-                self.user_profiles[user_id]["context"]["device"] = search["user_device"]
-                
-                # Update recent activity
-                search_date = datetime.strptime(search["date"], "%Y-%m-%d")
-                if (self.user_profiles[user_id]["recent_activity"]["last_active_date"] is None or
-                    search_date > datetime.strptime(self.user_profiles[user_id]["recent_activity"]["last_active_date"], "%Y-%m-%d")):
-                    self.user_profiles[user_id]["recent_activity"]["last_active_date"] = search["date"]
-                    self.user_profiles[user_id]["recent_activity"]["last_search_query"] = search["query"]
+    def _process_signals(self):
+        """
+        Process purchases, favorites, interactions and searches in one fused pass.
+        Sources are visited in that order, so the latest record of the last source still wins
+        for context fields, exactly as with one pass per source.
+        """
+        sources = (
+            ("purchases", self.data_loader.purchases),
+            ("favorites", self.data_loader.favorites),
+            ("interactions", self.data_loader.interactions),
+            ("searches", self.data_loader.searches)
+        )
+        # Bind everything the loop reuses to locals once, outside the per-record path
+        user_profiles = self.user_profiles
+        signal_weights = self.signal_weights
+        interaction_weights = self.interaction_weights
+        purchase_weight = signal_weights["purchase"]
+        favorite_weight = signal_weights["favorite"]
+        other_interaction_weight = signal_weights["other_interaction"]
+        get_price_range = self._get_price_range
+        
+        for kind, record in chain.from_iterable(zip(repeat(kind), records) for kind, records in sources):
+            # Records without a known user_id were already reported when initializing the profiles
+            profile = user_profiles.get(record.get("user_id"))
+            if profile is None:
+                continue
+            
+            # Add to behavior
+            profile["behavior"][kind].append(record)
+            
+            # Update context
+            profile["context"]["device"] = record["user_device"]
+            
+            # YYYY-MM-DD strings order lexicographically the same as chronologically
+            recent_activity = profile["recent_activity"]
+            record_date = record["date"]
+            last_active_date = recent_activity["last_active_date"]
+            is_latest = last_active_date is None or record_date > last_active_date
+            
+            if kind == "searches":
+                # Searches only contribute to recent activity
+                if is_latest:
+                    recent_activity["last_active_date"] = record_date
+                    recent_activity["last_search_query"] = record["query"]
+                continue
+            
+            if kind == "purchases":
+                weight = purchase_weight
+                price = float(record["purchase_price"])
+            elif kind == "favorites":
+                weight = favorite_weight
+                price = float(record["material_price"])
+            else:
+                # Interactions use smaller weights depending on their type
+                weight = interaction_weights.get(record["type"], other_interaction_weight)
+                price = float(record["material_price"])
+            
+            # Update preferences counters
+            preferences = profile["preferences"]
+            preferences["categories"][record["material_category"]] += weight
+            preferences["grade_levels"][record["class_grade"]] += weight
+            
+            # Categorize price ranges
+            preferences["price_ranges"][get_price_range(price)] += weight
+            
+            # Bundle preference
+            is_bundle = "1" if record["is_bundle"] == "1" else "0"
+            preferences["is_bundle"][is_bundle] += weight
+            
+            # Update recent activity
+            if is_latest:
+                recent_activity["last_active_date"] = record_date
+                if kind == "purchases":
+                    recent_activity["last_purchased_material"] = record["material_id"]
     
     def _infer_preferences(self):
         """
@@ -257,22 +224,22 @@ class UserProfileBuilder:
         for user_id, profile in self.user_profiles.items():
             # Get the most common preferences
             if profile["preferences"]["categories"]:
-                profile["preferred_category"] = profile["preferences"]["categories"].most_common(1)[0][0]
+                profile["preferred_category"] = max(profile["preferences"]["categories"], key=profile["preferences"]["categories"].get)
             else:
                 profile["preferred_category"] = None
                 
             if profile["preferences"]["grade_levels"]:
-                profile["preferred_grade"] = profile["preferences"]["grade_levels"].most_common(1)[0][0]
+                profile["preferred_grade"] = max(profile["preferences"]["grade_levels"], key=profile["preferences"]["grade_levels"].get)
             else:
                 profile["preferred_grade"] = None
                 
             if profile["preferences"]["price_ranges"]:
-                profile["preferred_price_range"] = profile["preferences"]["price_ranges"].most_common(1)[0][0]
+                profile["preferred_price_range"] = max(profile["preferences"]["price_ranges"], key=profile["preferences"]["price_ranges"].get)
             else:
                 profile["preferred_price_range"] = None
             
             if profile["preferences"]["is_bundle"]:
-                profile["preferred_bundle_status"] = profile["preferences"]["is_bundle"].most_common(1)[0][0]
+                profile["preferred_bundle_status"] = max(profile["preferences"]["is_bundle"], key=profile["preferences"]["is_bundle"].get)
             else:
                 profile["preferred_bundle_status"] = None
     
@@ -294,38 +261,113 @@ class RecommendationEngine:
     """
     Component responsible for generating recommendations using the rule-based approach.
     """
+    # Maximum number of cached recommendation lists kept by get_recommendations
+    REC_CACHE_SIZE = 1024
+    
     def __init__(self, data_loader, user_profiles):
         self.data_loader = data_loader
         self.user_profiles = user_profiles
         self.material_pool = list(data_loader.materials.values())
+        self._build_indices()
+        
+        # LRU cache of recommendation lists keyed by (user_id, limit, last_active_date)
+        self._rec_cache = OrderedDict()
+    
+    def _build_indices(self):
+        """
+        Build lookup indices over the material pool, each sorted by bestseller rating.
+        """
+        self.by_cat_grade = defaultdict(list)
+        self.by_grade = defaultdict(list)
+        for material in self.material_pool:
+            self.by_cat_grade[(material["category"], material["class_grade"])].append(material)
+            self.by_grade[material["class_grade"]].append(material)
+        
+        # Stable sorts keep material pool order between equally rated materials
+        by_rating = itemgetter("bestseller_rating")
+        for materials in self.by_cat_grade.values():
+            materials.sort(key=by_rating, reverse=True)
+        for materials in self.by_grade.values():
+            materials.sort(key=by_rating, reverse=True)
+        self.all_sorted = sorted(self.material_pool, key=by_rating, reverse=True)
     
     def get_recommendations(self, user_id, limit=5):
         """
         Generate recommendations for a specific user.
+        Results are cached per (user_id, limit, last_active_date), so new activity gets fresh ones.
+        """
+        profile = self.user_profiles.get(user_id)
+        last_active_date = profile["recent_activity"]["last_active_date"] if profile is not None else None
+        key = (user_id, limit, last_active_date)
+        
+        recommendations = self._rec_cache.get(key)
+        if recommendations is None:
+            recommendations = self._compute_recommendations(user_id, limit)
+            self._rec_cache[key] = recommendations
+            if len(self._rec_cache) > self.REC_CACHE_SIZE:
+                self._rec_cache.popitem(last=False)
+        else:
+            self._rec_cache.move_to_end(key)
+        # Return a copy so callers can't modify the cached list
+        return list(recommendations)
+    
+    def invalidate(self, user_id=None):
+        """
+        Drop cached recommendations for one user, or for all users if no user_id is given.
+        """
+        if user_id is None:
+            self._rec_cache.clear()
+        else:
+            for key in [key for key in self._rec_cache if key[0] == user_id]:
+                del self._rec_cache[key]
+    
+    def _compute_recommendations(self, user_id, limit=5):
+        """
+        Run the rule pipeline for a specific user.
         """
         # Check if user exists
         if user_id not in self.user_profiles:
             return self._get_fallback_recommendations(limit=limit)
         
-        # Get user profile
+        # Get user profile and the material ID sets shared by the rules
         profile = self.user_profiles[user_id]
+        ctx = self._build_context(profile)
         
         # Try behavior-based rules first
-        recommendations = self._apply_behavior_based_rules(profile, limit)
+        recommendations = self._apply_behavior_based_rules(profile, ctx, limit)
+        seen = {rec["material_id"] for rec in recommendations}
         
         # If not enough recommendations, try preference-based rules
         if len(recommendations) < limit:
-            preference_recs = self._apply_preference_based_rules(profile, limit - len(recommendations))
-            recommendations.extend([rec for rec in preference_recs if rec["material_id"] not in [r["material_id"] for r in recommendations]])
+            preference_recs = self._apply_preference_based_rules(profile, ctx, limit - len(recommendations))
+            for rec in preference_recs:
+                if rec["material_id"] not in seen:
+                    recommendations.append(rec)
+                    seen.add(rec["material_id"])
         
         # If still not enough, use fallback rules
         if len(recommendations) < limit:
             fallback_recs = self._get_fallback_recommendations(profile, limit - len(recommendations))
-            recommendations.extend([rec for rec in fallback_recs if rec["material_id"] not in [r["material_id"] for r in recommendations]])
+            for rec in fallback_recs:
+                if rec["material_id"] not in seen:
+                    recommendations.append(rec)
+                    seen.add(rec["material_id"])
         
         return recommendations[:limit]
     
-    def _apply_behavior_based_rules(self, profile, limit=5):
+    @staticmethod
+    def _build_context(profile):
+        """
+        Collect the purchased and favorite material IDs once per recommendation run,
+        for O(1) membership checks in the rules.
+        """
+        behavior = profile["behavior"]
+        return {
+            "purchased_ids": {p["material_id"] for p in behavior["purchases"]},
+            "favorite_ids": {fav["material_id"] for fav in behavior["favorites"]}
+        }
+    
+    def _apply_behavior_based_rules(self, profile, ctx, limit=5):
         """
         Apply behavior-based recommendation rules.
         """
@@ -337,79 +379,73 @@ class RecommendationEngine:
             if last_material_id in self.data_loader.materials:
                 last_material = self.data_loader.materials[last_material_id]
                 
-                # Find materials with same grade level and category
-                similar_materials = []
-                for material in self.material_pool:
-                    if (material["class_grade"] == last_material["class_grade"] and 
-                        material["category"] == last_material["category"] and 
-                        str(material["material_id"]) != last_material_id):
-                        
-                        # Calculate price similarity (within 2€)
-                        last_price = float(last_material["price"])
-                        current_price = float(material["price"])
-                        if abs(current_price - last_price) <= 2:
-                            similar_materials.append(material)
+                # Find materials with same grade level and category, already sorted by bestseller rating
+                candidates = self.by_cat_grade.get((last_material["category"], last_material["class_grade"]), ())
                 
-                # Sort by bestseller rating
-                similar_materials.sort(key=lambda x: float(x["bestseller_rating"]), reverse=True)
+                # Select the top rated materials with a similar price (within 2€)
+                last_price = last_material["price"]
+                similar_materials = islice(
+                    (material for material in candidates
+                     if material["_id_str"] != last_material_id and abs(material["price"] - last_price) <= 2),
+                    limit
+                )
                 
                 # Add recommendations
-                for material in similar_materials[:limit]:
-                    recommendations.append({
-                        "material_id": str(material["material_id"]),
-                        "title": material["title"],
-                        "category": material["category"],
-                        "class_grade": material["class_grade"],
-                        "price": material["price"],
-                        "bestseller_rating": material["bestseller_rating"],
-                        "is_bundle": material["is_bundle"],
-                        "rule": "recent_acquisition"
-                    })
+                for material in similar_materials:
+                    recommendations.append(self._to_rec(material, "recent_acquisition"))
         
         # Rule 2: Favorites - recommend materials similar to favorites
         if len(recommendations) < limit and profile["behavior"]["favorites"]:
             # Get all favorite material IDs
-            favorite_ids = [fav["material_id"] for fav in profile["behavior"]["favorites"]]
+            favorite_ids = ctx["favorite_ids"]
             
-            # Get favorite materials details
-            favorite_materials = [self.data_loader.materials.get(fav_id) for fav_id in favorite_ids if fav_id in self.data_loader.materials]
+            # Get favorite materials details, in favorites order so ties resolve deterministically
+            materials = self.data_loader.materials
+            favorite_materials = [
+                materials[fav["material_id"]] for fav in profile["behavior"]["favorites"]
+                if fav["material_id"] in materials
+            ]
             
             # Count favorite categories and grade levels
-            fav_categories = Counter([m["category"] for m in favorite_materials if m])
-            fav_grades = Counter([m["class_grade"] for m in favorite_materials if m])
+            fav_categories = Counter(m["category"] for m in favorite_materials)
+            fav_grades = Counter(m["class_grade"] for m in favorite_materials)
             
             # Get most common category and grade
-            most_common_category = fav_categories.most_common(1)[0][0] if fav_categories else None
-            most_common_grade = fav_grades.most_common(1)[0][0] if fav_grades else None
+            most_common_category = max(fav_categories, key=fav_categories.get) if fav_categories else None
+            most_common_grade = max(fav_grades, key=fav_grades.get) if fav_grades else None
             
             if most_common_category and most_common_grade:
-                # Find materials with same category and grade
-                similar_materials = []
-                for material in self.material_pool:
-                    if (material["category"] == most_common_category and
-                        material["class_grade"] == most_common_grade and
-                        str(material["material_id"]) not in favorite_ids):
-                        similar_materials.append(material)
-                
-                # Sort by bestseller rating
-                similar_materials.sort(key=lambda x: float(x["bestseller_rating"]), reverse=True)
+                # Find materials with same category and grade, already sorted by bestseller rating
+                # The first matches are the top-rated ones, so stop as soon as enough are found
+                candidates = self.by_cat_grade.get((most_common_category, most_common_grade), ())
+                similar_materials = islice(
+                    (material for material in candidates if material["_id_str"] not in favorite_ids),
+                    limit - len(recommendations)
+                )
                 
                 # Add recommendations
-                for material in similar_materials[:limit - len(recommendations)]:
-                    recommendations.append({
-                        "material_id": str(material["material_id"]),
-                        "title": material["title"],
-                        "category": material["category"],
-                        "class_grade": material["class_grade"],
-                        "price": material["price"],
-                        "bestseller_rating": material["bestseller_rating"],
-                        "is_bundle": material["is_bundle"],
-                        "rule": "favorites_based"
-                    })
+                for material in similar_materials:
+                    recommendations.append(self._to_rec(material, "favorites_based"))
         
         return recommendations
     
-    def _apply_preference_based_rules(self, profile, limit=5):
+    @staticmethod
+    def _to_rec(material, rule):
+        """
+        Build the recommendation record returned to callers for a material.
+        """
+        return {
+            "material_id": material["_id_str"],
+            "title": material["title"],
+            "category": material["category"],
+            "class_grade": material["class_grade"],
+            "price": material["price"],
+            "bestseller_rating": material["bestseller_rating"],
+            "is_bundle": material["is_bundle"],
+            "rule": rule
+        }
+    
+    def _apply_preference_based_rules(self, profile, ctx, limit=5):
         """
         Apply preference-based recommendation rules.
         """
@@ -417,30 +453,17 @@ class RecommendationEngine:
         
         # Rule 1: Category and Grade Preference
         if profile["preferred_category"] and profile["preferred_grade"]:
-            matching_materials = []
-            for material in self.material_pool:
-                if (material["category"] == profile["preferred_category"] and
-                    material["class_grade"] == profile["preferred_grade"]):
-                    # Check if this material was already purchased
-                    purchased_ids = [p["material_id"] for p in profile["behavior"]["purchases"]]
-                    if str(material["material_id"]) not in purchased_ids:
-                        matching_materials.append(material)
-            
-            # Sort by bestseller rating
-            matching_materials.sort(key=lambda x: float(x["bestseller_rating"]), reverse=True)
+            # Skip materials that were already purchased
+            purchased_ids = ctx["purchased_ids"]
+            candidates = self.by_cat_grade.get((profile["preferred_category"], profile["preferred_grade"]), ())
+            matching_materials = islice(
+                (material for material in candidates if material["_id_str"] not in purchased_ids),
+                limit
+            )
             
             # Add recommendations
-            for material in matching_materials[:limit]:
-                recommendations.append({
-                    "material_id": str(material["material_id"]),
-                    "title": material["title"],
-                    "category": material["category"],
-                    "class_grade": material["class_grade"],
-                    "price": material["price"],
-                    "bestseller_rating": material["bestseller_rating"],
-                    "is_bundle": material["is_bundle"],
-                    "rule": "category_grade_preference"
-                })
+            for material in matching_materials:
+                recommendations.append(self._to_rec(material, "category_grade_preference"))
         
         # Rule 2: Price Range Preference
         if len(recommendations) < limit and profile["preferred_price_range"]:
@@ -456,33 +479,24 @@ class RecommendationEngine:
             elif price_range == "high":
                 min_price, max_price = 7.01, float('inf')
             
-            matching_materials = []
-            for material in self.material_pool:
-                price = float(material["price"]) if isinstance(material["price"], (int, float, str)) else 0
-                if min_price <= price <= max_price:
-                    # Prioritize materials matching the preferred grade if available
-                    if profile["preferred_grade"] and material["class_grade"] == profile["preferred_grade"]:
-                        matching_materials.append((material, 2))  # Higher priority
-                    else:
-                        matching_materials.append((material, 1))  # Lower priority
-            
-            # Sort by priority then bestseller rating
-            matching_materials.sort(key=lambda x: (x[1], float(x[0]["bestseller_rating"])), reverse=True)
+            # Prioritize materials matching the preferred grade, then the rest, each by bestseller rating
+            # (consumed lazily, so only the head of each list is visited)
+            preferred_grade = profile["preferred_grade"]
+            matching_materials = (
+                m for m in chain(
+                    self.by_grade.get(preferred_grade, ()) if preferred_grade else (),
+                    (m for m in self.all_sorted if not preferred_grade or m["class_grade"] != preferred_grade)
+                )
+                if min_price <= m["price"] <= max_price
+            )
             
             # Add recommendations
-            for material, _ in matching_materials[:limit - len(recommendations)]:
+            excluded = {r["material_id"] for r in recommendations}
+            for material in islice(matching_materials, limit - len(recommendations)):
                 # Check if already recommended
-                if material["material_id"] not in [r["material_id"] for r in recommendations]:
-                    recommendations.append({
-                        "material_id": str(material["material_id"]),
-                        "title": material["title"],
-                        "category": material["category"],
-                        "class_grade": material["class_grade"],
-                        "price": material["price"],
-                        "bestseller_rating": material["bestseller_rating"],
-                        "is_bundle": material["is_bundle"],
-                        "rule": "price_preference"
-                    })
+                if material["_id_str"] not in excluded:
+                    excluded.add(material["_id_str"])
+                    recommendations.append(self._to_rec(material, "price_preference"))
         
         return recommendations
     
@@ -494,45 +508,22 @@ class RecommendationEngine:
         
         # If we have a profile, use its preferred grade level if available
         if profile and profile["preferred_grade"]:
-            # Find popular materials for that grade level
-            grade_materials = [m for m in self.material_pool if m["class_grade"] == profile["preferred_grade"]]
-            # Sort by bestseller rating
-            grade_materials.sort(key=lambda x: float(x["bestseller_rating"]), reverse=True)
+            # Find popular materials for that grade level, already sorted by bestseller rating
+            grade_materials = self.by_grade.get(profile["preferred_grade"], ())
             
             # Add recommendations
             for material in grade_materials[:limit]:
-                recommendations.append({
-                    "material_id": str(material["material_id"]),
-                    "title": material["title"],
-                    "category": material["category"],
-                    "class_grade": material["class_grade"],
-                    "price": material["price"],
-                    "bestseller_rating": material["bestseller_rating"],
-                    "is_bundle": material["is_bundle"],
-                    "rule": "popular_by_grade"
-                })
+                recommendations.append(self._to_rec(material, "popular_by_grade"))
         
         # If still not enough or no profile provided, return overall most popular
         if len(recommendations) < limit:
-            # Sort all materials by bestseller rating
-            popular_materials = sorted(self.material_pool, 
-                                      key=lambda x: float(x["bestseller_rating"]), 
-                                      reverse=True)
-            
-            # Add recommendations
-            for material in popular_materials[:limit - len(recommendations)]:
+            # Add recommendations from all materials sorted by bestseller rating
+            excluded = {r["material_id"] for r in recommendations}
+            for material in self.all_sorted[:limit - len(recommendations)]:
                 # Check if already recommended
-                if material["material_id"] not in [r["material_id"] for r in recommendations]:
-                    recommendations.append({
-                        "material_id": str(material["material_id"]),
-                        "title": material["title"],
-                        "category": material["category"],
-                        "class_grade": material["class_grade"],
-                        "price": material["price"],
-                        "bestseller_rating": material["bestseller_rating"],
-                        "is_bundle": material["is_bundle"],
-                        "rule": "overall_popular"
-                    })
+                if material["_id_str"] not in excluded:
+                    excluded.add(material["_id_str"])
+                    recommendations.append(self._to_rec(material, "overall_popular"))
         
         return recommendations
 
@@ -540,12 +531,21 @@ class RecommendationEngine:
 class PersonalizationService:
     """
     Main service class that orchestrates the personalization process.
+    
+    With use_profile_cache=True the built user profiles are pickled to profiles_<hash>.pkl
+    in the data directory and loaded from there on later starts. Loading a pickle can run
+    arbitrary code, so only enable the cache when the data directory is writable by trusted
+    users alone.
     """
-    def __init__(self, data_path="."):
+    # Input files that user profiles are built from
+    PROFILE_SOURCE_FILES = ("materials.json", "purchases.json", "favorites.json", "interactions.json", "searches.json")
+    
+    def __init__(self, data_path=".", use_profile_cache=False):
         self.data_loader = None
         self.user_profiles = {}
         self.recommendation_engine = None
         self.data_path = data_path
+        self.use_profile_cache = use_profile_cache
     
     def initialize(self):
         """
@@ -556,9 +556,17 @@ class PersonalizationService:
         # Load data
         self.data_loader = DataLoader(self.data_path).load_data()
         
-        # Build user profiles
+        # Build user profiles, or reuse the cached ones if the input files, weights and code are unchanged
         profile_builder = UserProfileBuilder(self.data_loader)
-        self.user_profiles = profile_builder.build_profiles()
+        cache_path = self._profile_cache_path(profile_builder) if self.use_profile_cache else None
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                self.user_profiles = pickle.load(f)
+            print(f"Loaded user profiles from {cache_path}")
+        else:
+            self.user_profiles = profile_builder.build_profiles()
+            if cache_path:
+                self._save_profile_cache(cache_path)
         
         # Initialize recommendation engine
         self.recommendation_engine = RecommendationEngine(self.data_loader, self.user_profiles)
@@ -566,6 +574,45 @@ class PersonalizationService:
         print(f"Personalization Service initialized with {len(self.user_profiles)} user profiles.")
         return self
     
+    def _profile_cache_path(self, profile_builder):
+        """
+        Path of the profile cache for the current input files, keyed by their modification times,
+        the builder's signal weights and the source of this module.
+        """
+        with open(__file__, "rb") as f:
+            code_digest = hashlib.md5(f.read()).hexdigest()
+        signature = [
+            code_digest,
+            sorted(profile_builder.signal_weights.items()),
+            sorted(profile_builder.interaction_weights.items())
+        ]
+        signature.extend(
+            (file_name, os.path.getmtime(os.path.join(self.data_path, file_name)))
+            for file_name in self.PROFILE_SOURCE_FILES
+        )
+        digest = hashlib.md5(str(signature).encode()).hexdigest()
+        return os.path.join(self.data_path, f"profiles_{digest}.pkl")
+    
+    def _save_profile_cache(self, cache_path):
+        """
+        Write the built user profiles to disk; a failed write only costs the next warm start.
+        Caches for older inputs, weights or code are removed, so only the current one is kept.
+        """
+        try:
+            with open(cache_path, "wb") as f:
+                pickle.dump(self.user_profiles, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"Warning: Could not write profile cache {cache_path}: {e}")
+            return
+        
+        for stale_path in glob.glob(os.path.join(glob.escape(self.data_path), "profiles_*.pkl")):
+            if os.path.abspath(stale_path) == os.path.abspath(cache_path):
+                continue
+            try:
+                os.remove(stale_path)
+            except OSError as e:
+                print(f"Warning: Could not remove stale profile cache {stale_path}: {e}")
+    
     def get_recommendations_for_user(self, user_id, limit=5):
         """
         Get personalized recommendations for a specific user.
@@ -1,9 +1,41 @@
 import json
 import os
-from datetime import datetime
-from collections import Counter, defaultdict
+import sys
+from bisect import bisect_left, bisect_right
+from heapq import nlargest, nsmallest
+from itertools import chain, islice, repeat
+from operator import itemgetter
+from collections import OrderedDict, defaultdict
 from typing import Dict, List, Tuple, Set, Any
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library parser
+    orjson = None
+
+# Upper bounds (inclusive) of the paid price ranges; anything above the last one is "high"
+_PRICE_BOUNDS = (3, 7)
+_PRICE_LABELS = ("low", "medium", "high")
+
+# Price bounds (inclusive) used when recommending by preferred price range
+_PRICE_RANGE_BOUNDS = {
+    "free": (0, 0),
+    "low": (0.01, 3),
+    "medium": (3.01, 7),
+    "high": (7.01, float('inf'))
+}
+
+
+def _most_common(values):
+    """
+    Return the most frequent value (the first one seen on ties), or None if there are no values.
+    """
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return max(counts, key=counts.get) if counts else None
+
+
 class DataLoader:
     """
     Component responsible for loading and preprocessing the data.
@@ -21,23 +53,41 @@ class DataLoader:
         Load all data files from the specified path.
         """
         # Load materials
-        with open(os.path.join(self.data_path, "materials.json"), "r") as f:
-            materials_data = json.load(f)
-            # Index materials by ID for faster lookup
-            self.materials = {str(item["material_id"]): item for item in materials_data}
+        materials_data = self._load_json("materials.json")
+        # Convert numeric fields once so the rules can compare and sort them directly
+        for item in materials_data:
+            item["price"] = float(item["price"])
+            item["bestseller_rating"] = float(item["bestseller_rating"])
+            # Behavior records reference materials by string ID, so store it as a string too
+            item["material_id"] = str(item["material_id"])
+            # Intern category/grade labels so equal labels share one string object
+            item["category"] = sys.intern(item["category"])
+            item["class_grade"] = sys.intern(item["class_grade"])
+        # Index materials by ID for faster lookup
+        self.materials = {item["material_id"]: item for item in materials_data}
         
         # Load user behavior data
-        with open(os.path.join(self.data_path, "purchases.json"), "r") as f:
-            self.purchases = json.load(f)
-        
-        with open(os.path.join(self.data_path, "favorites.json"), "r") as f:
-            self.favorites = json.load(f)
-        
-        with open(os.path.join(self.data_path, "interactions.json"), "r") as f:
-            self.interactions = json.load(f)
-        
-        with open(os.path.join(self.data_path, "searches.json"), "r") as f:
-            self.searches = json.load(f)
+        self.purchases = self._load_json("purchases.json")
+        self.favorites = self._load_json("favorites.json")
+        self.interactions = self._load_json("interactions.json")
+        self.searches = self._load_json("searches.json")
+        
+        # Behavior prices are stored as strings and bundle flags as "0"/"1"; convert them once here
+        for purchase in self.purchases:
+            purchase["purchase_price"] = float(purchase["purchase_price"])
+        for record in chain(self.favorites, self.interactions):
+            record["material_price"] = float(record["material_price"])
+        for record in chain(self.purchases, self.favorites, self.interactions):
+            record["is_bundle"] = 1 if record["is_bundle"] == "1" else 0
+            # Material ids are compared against the string-keyed materials index
+            record["material_id"] = str(record["material_id"])
+        
+        # Intern the behavior category/grade labels too (searches may lack them)
+        for record in chain(self.purchases, self.favorites, self.interactions, self.searches):
+            if "material_category" in record:
+                record["material_category"] = sys.intern(record["material_category"])
+            if "class_grade" in record:
+                record["class_grade"] = sys.intern(record["class_grade"])
         
         print(f"Loaded {len(self.materials)} materials")
         print(f"Loaded {len(self.purchases)} purchases")
@@ -46,6 +96,17 @@ class DataLoader:
         print(f"Loaded {len(self.searches)} searches")
         
         return self
+    
+    def _load_json(self, file_name):
+        """
+        Parse a JSON file from the data path, using orjson when it is installed.
+        """
+        path = os.path.join(self.data_path, file_name)
+        if orjson is not None:
+            with open(path, "rb") as f:
+                return orjson.loads(f.read())
+        with open(path, "r") as f:
+            return json.load(f)
 
 
 class UserProfileBuilder:
@@ -83,11 +144,8 @@ class UserProfileBuilder:
         # Initialize user profiles
         self._initialize_user_profiles()
         
-        # Process different types of signals
-        self._process_purchases()
-        self._process_favorites()
-        self._process_interactions()
-        self._process_searches()
+        # Process all types of signals in one pass
+        self._process_signals()
         
         # Infer preferences based on behaviors
         self._infer_preferences()
@@ -99,18 +157,22 @@ class UserProfileBuilder:
         Initialize user profiles with empty structures.
         """
         # Get all unique user IDs from all data sources
-        user_ids = set()
-        for purchase in self.data_loader.purchases:
-            user_ids.add(purchase["user_id"])
-        for favorite in self.data_loader.favorites:
-            user_ids.add(favorite["user_id"])
-        for interaction in self.data_loader.interactions:
-            user_ids.add(interaction["user_id"])
-        for search in self.data_loader.searches:
-            user_ids.add(search["user_id"])
+        user_ids = {
+            record["user_id"]
+            for record in chain(
+                self.data_loader.purchases,
+                self.data_loader.favorites,
+                self.data_loader.interactions,
+                self.data_loader.searches
+            )
+        }
         
         # Initialize empty profiles
         for user_id in user_ids:
+            # Category/grade preferences and affinity scores received identical updates,
+            # so both names share one dict and every signal is accumulated once
+            subject_affinity_score = defaultdict(float)
+            grade_affinity_score = defaultdict(float)
             self.user_profiles[user_id] = {
                 "user_id": user_id,
                 "behavior": {
@@ -122,8 +184,8 @@ class UserProfileBuilder:
                     "previewed_materials": set()  # Track previewed materials separately
                 },
                 "preferences": {
-                    "categories": defaultdict(float),
-                    "grade_levels": defaultdict(float),
+                    "categories": subject_affinity_score,
+                    "grade_levels": grade_affinity_score,
                     "price_ranges": defaultdict(float),
                     "is_bundle": defaultdict(float)
                 },
@@ -137,254 +199,150 @@ class UserProfileBuilder:
                     "last_viewed_material": None,
                     "last_previewed_material": None
                 },
-                "subject_affinity_score": defaultdict(float),  # New category affinity tracking
-                "grade_affinity_score": defaultdict(float)     # New grade affinity tracking
+                "subject_affinity_score": subject_affinity_score,  # New category affinity tracking
+                "grade_affinity_score": grade_affinity_score      # New grade affinity tracking
             }
     
-    def _process_purchases(self):
-        """
-        Process purchase data to enrich user profiles.
-        """
-        for purchase in self.data_loader.purchases:
-            user_id = purchase["user_id"]
-            if user_id in self.user_profiles:
-                # Add to behavior
-                self.user_profiles[user_id]["behavior"]["purchases"].append(purchase)
-                
-                # Update preferences counters
-                category_weight = self.signal_weights["purchase"] * self.signal_weights["category_multiplier"]
-                grade_weight = self.signal_weights["purchase"] * self.signal_weights["grade_multiplier"]
-                
-                self.user_profiles[user_id]["preferences"]["categories"][purchase["material_category"]] += category_weight
-                self.user_profiles[user_id]["preferences"]["grade_levels"][purchase["class_grade"]] += grade_weight
-                
-                # Update subject and grade affinity scores
-                self.user_profiles[user_id]["subject_affinity_score"][purchase["material_category"]] += category_weight
-                self.user_profiles[user_id]["grade_affinity_score"][purchase["class_grade"]] += grade_weight
-                
-                # Categorize price ranges
-                price = float(purchase["purchase_price"])
-                price_range = self._get_price_range(price)
-                self.user_profiles[user_id]["preferences"]["price_ranges"][price_range] += self.signal_weights["purchase"]
-                
-                # Bundle preference
-                is_bundle = "1" if purchase["is_bundle"] == "1" else "0"
-                self.user_profiles[user_id]["preferences"]["is_bundle"][is_bundle] += self.signal_weights["purchase"]
-                
-                # Update context
-                self.user_profiles[user_id]["context"]["device"] = purchase["user_device"]
-                
-                # Update recent activity
-                purchase_date = datetime.strptime(purchase["date"], "%Y-%m-%d")
-                if (self.user_profiles[user_id]["recent_activity"]["last_active_date"] is None or
-                    purchase_date > datetime.strptime(self.user_profiles[user_id]["recent_activity"]["last_active_date"], "%Y-%m-%d")):
-                    self.user_profiles[user_id]["recent_activity"]["last_active_date"] = purchase["date"]
-                    self.user_profiles[user_id]["recent_activity"]["last_purchased_material"] = purchase["material_id"]
-    
-    def _process_favorites(self):
-        """
-        Process favorites data to enrich user profiles with reduced weight.
-        """
-        for favorite in self.data_loader.favorites:
-            user_id = favorite["user_id"]
-            if user_id in self.user_profiles:
-                # Add to behavior
-                self.user_profiles[user_id]["behavior"]["favorites"].append(favorite)
-                
-                # Update preferences counters - reduced weight based on correlation data
-                category_weight = self.signal_weights["favorite"] * self.signal_weights["category_multiplier"]
-                grade_weight = self.signal_weights["favorite"] * self.signal_weights["grade_multiplier"]
-                
-                self.user_profiles[user_id]["preferences"]["categories"][favorite["material_category"]] += category_weight
-                self.user_profiles[user_id]["preferences"]["grade_levels"][favorite["class_grade"]] += grade_weight
-                
-                # Update subject and grade affinity scores
-                self.user_profiles[user_id]["subject_affinity_score"][favorite["material_category"]] += category_weight
-                self.user_profiles[user_id]["grade_affinity_score"][favorite["class_grade"]] += grade_weight
-                
-                # Categorize price ranges
-                price = float(favorite["material_price"])
-                price_range = self._get_price_range(price)
-                self.user_profiles[user_id]["preferences"]["price_ranges"][price_range] += self.signal_weights["favorite"]
-                
-                # Bundle preference
-                is_bundle = "1" if favorite["is_bundle"] == "1" else "0"
-                self.user_profiles[user_id]["preferences"]["is_bundle"][is_bundle] += self.signal_weights["favorite"]
-                
-                # Update context
-                self.user_profiles[user_id]["context"]["device"] = favorite["user_device"]
-                
-                # Update recent activity
-                favorite_date = datetime.strptime(favorite["date"], "%Y-%m-%d")
-                if (self.user_profiles[user_id]["recent_activity"]["last_active_date"] is None or
-                    favorite_date > datetime.strptime(self.user_profiles[user_id]["recent_activity"]["last_active_date"], "%Y-%m-%d")):
-                    self.user_profiles[user_id]["recent_activity"]["last_active_date"] = favorite["date"]
-    
-    def _process_interactions(self):
-        """
-        Process interaction data with updated weights based on correlation analysis.
-        """
-        for interaction in self.data_loader.interactions:
-            user_id = interaction["user_id"]
-            if user_id in self.user_profiles:
-                # Add to behavior
-                self.user_profiles[user_id]["behavior"]["interactions"].append(interaction)
-                
-                # Determine weight based on interaction type
-                interaction_type = interaction["type"]
-                if interaction_type == "view_material":
-                    weight = self.signal_weights["view_material"]
-                    # Track viewed materials
-                    self.user_profiles[user_id]["behavior"]["viewed_materials"].add(interaction["material_id"])
-                    # Update last viewed material
-                    interaction_date = datetime.strptime(interaction["date"], "%Y-%m-%d")
-                    if (self.user_profiles[user_id]["recent_activity"]["last_viewed_material"] is None or
-                        interaction_date > datetime.strptime(self.user_profiles[user_id]["recent_activity"].get("last_viewed_date", "2000-01-01"), "%Y-%m-%d")):
-                        self.user_profiles[user_id]["recent_activity"]["last_viewed_material"] = interaction["material_id"]
-                        self.user_profiles[user_id]["recent_activity"]["last_viewed_date"] = interaction["date"]
-                elif interaction_type == "view_preview":
-                    weight = self.signal_weights["view_preview"]
-                    # Track previewed materials
-                    self.user_profiles[user_id]["behavior"]["previewed_materials"].add(interaction["material_id"])
-                    # Update last previewed material
-                    interaction_date = datetime.strptime(interaction["date"], "%Y-%m-%d")
-                    if (self.user_profiles[user_id]["recent_activity"]["last_previewed_material"] is None or
-                        interaction_date > datetime.strptime(self.user_profiles[user_id]["recent_activity"].get("last_previewed_date", "2000-01-01"), "%Y-%m-%d")):
-                        self.user_profiles[user_id]["recent_activity"]["last_previewed_material"] = interaction["material_id"]
-                        self.user_profiles[user_id]["recent_activity"]["last_previewed_date"] = interaction["date"]
-                elif interaction_type == "add_to_cart":
-                    weight = self.signal_weights["add_to_cart"]
-                elif interaction_type == "download":
-                    weight = self.signal_weights["download"]
-                else:  # Default to click
-                    weight = self.signal_weights["click"]
+    def _process_signals(self):
+        """
+        Process purchases, favorites, interactions and searches in one fused pass.
+        Sources are visited in that order, so the last record still wins for context fields.
+        """
+        sources = (
+            ("purchases", self.data_loader.purchases),
+            ("favorites", self.data_loader.favorites),
+            ("interactions", self.data_loader.interactions),
+            ("searches", self.data_loader.searches)
+        )
+        user_profiles = self.user_profiles
+        sw = self.signal_weights
+        cat_mul = sw["category_multiplier"]
+        grade_mul = sw["grade_multiplier"]
+        get_price_range = self._get_price_range
+        
+        for kind, record in chain.from_iterable(zip(repeat(kind), records) for kind, records in sources):
+            profile = user_profiles.get(record["user_id"])
+            if profile is None:
+                continue
+            
+            behavior = profile["behavior"]
+            prefs = profile["preferences"]
+            recent = profile["recent_activity"]
+            
+            # Add to behavior
+            behavior[kind].append(record)
+            # YYYY-MM-DD strings order lexicographically the same as chronologically
+            record_date = record["date"]
+            
+            if kind == "searches":
+                # Apply search weight to subject category and grade when the search carries them
+                if "material_category" in record:
+                    category_weight = sw["search"] * cat_mul
+                    profile["subject_affinity_score"][record["material_category"]] += category_weight
+                if "class_grade" in record:
+                    grade_weight = sw["search"] * grade_mul
+                    profile["grade_affinity_score"][record["class_grade"]] += grade_weight
+            else:
+                # Determine weight and price based on the signal type
+                if kind == "purchases":
+                    weight = sw["purchase"]
+                    price = record["purchase_price"]
+                elif kind == "favorites":
+                    # Reduced weight based on correlation data
+                    weight = sw["favorite"]
+                    price = record["material_price"]
+                else:
+                    price = record["material_price"]
+                    interaction_type = record["type"]
+                    if interaction_type == "view_material":
+                        weight = sw["view_material"]
+                        # Track viewed materials and the last viewed one
+                        behavior["viewed_materials"].add(record["material_id"])
+                        if (recent["last_viewed_material"] is None or
+                            record_date > recent.get("last_viewed_date", "2000-01-01")):
+                            recent["last_viewed_material"] = record["material_id"]
+                            recent["last_viewed_date"] = record_date
+                    elif interaction_type == "view_preview":
+                        weight = sw["view_preview"]
+                        # Track previewed materials and the last previewed one
+                        behavior["previewed_materials"].add(record["material_id"])
+                        if (recent["last_previewed_material"] is None or
+                            record_date > recent.get("last_previewed_date", "2000-01-01")):
+                            recent["last_previewed_material"] = record["material_id"]
+                            recent["last_previewed_date"] = record_date
+                    elif interaction_type == "add_to_cart":
+                        weight = sw["add_to_cart"]
+                    elif interaction_type == "download":
+                        weight = sw["download"]
+                    else:  # Default to click
+                        weight = sw["click"]
                 
                 # Apply category vs grade multipliers
-                category_weight = weight * self.signal_weights["category_multiplier"]
-                grade_weight = weight * self.signal_weights["grade_multiplier"]
+                category_weight = weight * cat_mul
+                grade_weight = weight * grade_mul
                 
-                # Update preferences
-                self.user_profiles[user_id]["preferences"]["categories"][interaction["material_category"]] += category_weight
-                self.user_profiles[user_id]["preferences"]["grade_levels"][interaction["class_grade"]] += grade_weight
-                
-                # Update subject and grade affinity scores
-                self.user_profiles[user_id]["subject_affinity_score"][interaction["material_category"]] += category_weight
-                self.user_profiles[user_id]["grade_affinity_score"][interaction["class_grade"]] += grade_weight
+                # Update subject and grade affinity scores (aliased as preferences categories/grade_levels)
+                profile["subject_affinity_score"][record["material_category"]] += category_weight
+                profile["grade_affinity_score"][record["class_grade"]] += grade_weight
                 
                 # Categorize price ranges
-                price = float(interaction["material_price"])
-                price_range = self._get_price_range(price)
-                self.user_profiles[user_id]["preferences"]["price_ranges"][price_range] += weight
-                
-                # Bundle preference
-                is_bundle = "1" if interaction["is_bundle"] == "1" else "0"
-                self.user_profiles[user_id]["preferences"]["is_bundle"][is_bundle] += weight
-                
-                # Update context
-                self.user_profiles[user_id]["context"]["device"] = interaction["user_device"]
-                
-                # Update recent activity
-                interaction_date = datetime.strptime(interaction["date"], "%Y-%m-%d")
-                if (self.user_profiles[user_id]["recent_activity"]["last_active_date"] is None or
-                    interaction_date > datetime.strptime(self.user_profiles[user_id]["recent_activity"]["last_active_date"], "%Y-%m-%d")):
-                    self.user_profiles[user_id]["recent_activity"]["last_active_date"] = interaction["date"]
-    
-    def _process_searches(self):
-        """
-        Process search data with increased weight based on correlation analysis.
-        """
-        for search in self.data_loader.searches:
-            user_id = search["user_id"]
-            if user_id in self.user_profiles:
-                # Add to behavior
-                self.user_profiles[user_id]["behavior"]["searches"].append(search)
-                
-                # Apply search weight to subject category (no grade data in searches)
-                category_weight = self.signal_weights["search"] * self.signal_weights["category_multiplier"]
-                
-                # Update category preference from search result
-                if "material_category" in search:
-                    self.user_profiles[user_id]["preferences"]["categories"][search["material_category"]] += category_weight
-                    self.user_profiles[user_id]["subject_affinity_score"][search["material_category"]] += category_weight
-                
-                # Update grade preference if available
-                if "class_grade" in search:
-                    grade_weight = self.signal_weights["search"] * self.signal_weights["grade_multiplier"]
-                    self.user_profiles[user_id]["preferences"]["grade_levels"][search["class_grade"]] += grade_weight
-                    self.user_profiles[user_id]["grade_affinity_score"][search["class_grade"]] += grade_weight
+                prefs["price_ranges"][get_price_range(price)] += weight
                 
-                # Update context
-                self.user_profiles[user_id]["context"]["device"] = search["user_device"]
-                
-                # Update recent activity
-                search_date = datetime.strptime(search["date"], "%Y-%m-%d")
-                if (self.user_profiles[user_id]["recent_activity"]["last_active_date"] is None or
-                    search_date > datetime.strptime(self.user_profiles[user_id]["recent_activity"]["last_active_date"], "%Y-%m-%d")):
-                    self.user_profiles[user_id]["recent_activity"]["last_active_date"] = search["date"]
-                    self.user_profiles[user_id]["recent_activity"]["last_search_query"] = search["query"]
+                # Bundle preference (is_bundle is 0/1 since load time)
+                prefs["is_bundle"][record["is_bundle"]] += weight
+            
+            # Update context
+            profile["context"]["device"] = record["user_device"]
+            
+            # Update recent activity
+            if recent["last_active_date"] is None or record_date > recent["last_active_date"]:
+                recent["last_active_date"] = record_date
+                if kind == "purchases":
+                    recent["last_purchased_material"] = record["material_id"]
+                elif kind == "searches":
+                    recent["last_search_query"] = record["query"]
     
     def _infer_preferences(self):
         """
         Infer user preferences based on their behavior patterns.
         """
         for user_id, profile in self.user_profiles.items():
-            # Get the most common preferences
+            # Generate ranked lists of preferences (not just the top one)
+            profile["ranked_categories"] = sorted(
+                profile["subject_affinity_score"].items(),
+                key=itemgetter(1),
+                reverse=True
+            )
+            
+            profile["ranked_grades"] = sorted(
+                profile["grade_affinity_score"].items(),
+                key=itemgetter(1),
+                reverse=True
+            )
+            
+            # Top category and grade are the heads of the ranked lists
             if profile["preferences"]["categories"]:
-                # Sort by score rather than just counting occurrences
-                sorted_categories = sorted(
-                    profile["subject_affinity_score"].items(), 
-                    key=lambda x: x[1], 
-                    reverse=True
-                )
-                profile["preferred_category"] = sorted_categories[0][0] if sorted_categories else None
+                profile["preferred_category"] = profile["ranked_categories"][0][0]
             else:
                 profile["preferred_category"] = None
                 
             if profile["preferences"]["grade_levels"]:
-                # Sort by score rather than just counting occurrences
-                sorted_grades = sorted(
-                    profile["grade_affinity_score"].items(), 
-                    key=lambda x: x[1], 
-                    reverse=True
-                )
-                profile["preferred_grade"] = sorted_grades[0][0] if sorted_grades else None
+                profile["preferred_grade"] = profile["ranked_grades"][0][0]
             else:
                 profile["preferred_grade"] = None
                 
-            if profile["preferences"]["price_ranges"]:
-                # Get most common price range
-                sorted_prices = sorted(
-                    profile["preferences"]["price_ranges"].items(),
-                    key=lambda x: x[1],
-                    reverse=True
-                )
-                profile["preferred_price_range"] = sorted_prices[0][0] if sorted_prices else None
+            # Only the top entry is needed, so take the max instead of sorting
+            price_ranges = profile["preferences"]["price_ranges"]
+            if price_ranges:
+                profile["preferred_price_range"] = max(price_ranges.items(), key=itemgetter(1))[0]
             else:
                 profile["preferred_price_range"] = None
             
-            if profile["preferences"]["is_bundle"]:
-                # Get bundle preference
-                sorted_bundles = sorted(
-                    profile["preferences"]["is_bundle"].items(),
-                    key=lambda x: x[1],
-                    reverse=True
-                )
-                profile["preferred_bundle_status"] = sorted_bundles[0][0] if sorted_bundles else None
+            bundle_scores = profile["preferences"]["is_bundle"]
+            if bundle_scores:
+                profile["preferred_bundle_status"] = max(bundle_scores.items(), key=itemgetter(1))[0]
             else:
                 profile["preferred_bundle_status"] = None
-                
-            # Generate ranked lists of preferences (not just the top one)
-            profile["ranked_categories"] = sorted(
-                profile["subject_affinity_score"].items(),
-                key=lambda x: x[1],
-                reverse=True
-            )
-            
-            profile["ranked_grades"] = sorted(
-                profile["grade_affinity_score"].items(),
-                key=lambda x: x[1],
-                reverse=True
-            )
     
     def _get_price_range(self, price):
         """
@@ -392,12 +350,7 @@ class UserProfileBuilder:
         """
         if price == 0:
             return "free"
-        elif price <= 3:
-            return "low"
-        elif price <= 7:
-            return "medium"
-        else:
-            return "high"
+        return _PRICE_LABELS[bisect_left(_PRICE_BOUNDS, price)]
 
 
 class RecommendationEngine:
@@ -405,11 +358,58 @@ class RecommendationEngine:
     Updated component responsible for generating recommendations using the rule-based approach.
     Prioritizes view/preview behaviors based on correlation analysis.
     """
+    # Maximum number of cached recommendation lists kept by get_recommendations
+    REC_CACHE_SIZE = 1024
+    
     def __init__(self, data_loader, user_profiles):
         self.data_loader = data_loader
         self.user_profiles = user_profiles
         self.material_pool = list(data_loader.materials.values())
         
+        # Inverted index of materials per (category, class_grade), each bucket sorted by
+        # bestseller rating (stable, so ties keep pool order) for the similar-material rules
+        self.by_cat_grade = defaultdict(list)
+        # Materials per class_grade, for the grade-level fallback
+        self.by_grade = defaultdict(list)
+        for material in self.material_pool:
+            self.by_cat_grade[(material["category"], material["class_grade"])].append(material)
+            self.by_grade[material["class_grade"]].append(material)
+        for bucket in chain(self.by_cat_grade.values(), self.by_grade.values()):
+            bucket.sort(key=itemgetter("bestseller_rating"), reverse=True)
+        
+        # Price-sorted copy of each (category, class_grade) bucket for the price-window lookups,
+        # plus each material's position in its rating-ordered bucket to restore that order
+        self.by_cat_grade_price = {}
+        self._rating_rank = {}
+        for key, bucket in self.by_cat_grade.items():
+            for rank, material in enumerate(bucket):
+                self._rating_rank[material["material_id"]] = rank
+            by_price = sorted(bucket, key=itemgetter("price"))
+            self.by_cat_grade_price[key] = ([m["price"] for m in by_price], by_price)
+        
+        # Whole pool by bestseller rating, for the overall fallback
+        self.popular_materials = sorted(self.material_pool, key=itemgetter("bestseller_rating"), reverse=True)
+        
+        # Materials per preferred price range, in bestseller rating order
+        self.by_price_range = {
+            price_range: [m for m in self.popular_materials if min_price <= m["price"] <= max_price]
+            for price_range, (min_price, max_price) in _PRICE_RANGE_BOUNDS.items()
+        }
+        
+        # Per-material recommendation fields, copied by _to_rec instead of rebuilt per record
+        self._rec_templates = {
+            m["material_id"]: {
+                "material_id": m["material_id"],
+                "title": m["title"],
+                "category": m["category"],
+                "class_grade": m["class_grade"],
+                "price": m["price"],
+                "bestseller_rating": m["bestseller_rating"],
+                "is_bundle": m["is_bundle"]
+            }
+            for m in self.material_pool
+        }
+        
         # Define rule priorities based on correlation analysis
         self.rule_priorities = {
             "view_based": 1,        # Highest priority - 46-52% correlation
@@ -423,363 +423,284 @@ class RecommendationEngine:
             "popular_by_grade": 9,
             "overall_popular": 10
         }
+        
+        # Behavior rules in priority order, assembled once instead of on every request
+        self._rules = sorted(
+            [
+                ("view_based", self._apply_view_based_rules),
+                ("preview_based", self._apply_preview_based_rules),
+                ("recent_acquisition", self._apply_acquisition_based_rules),
+                ("search_based", self._apply_search_based_rules),
+                ("cart_based", self._apply_cart_based_rules),
+                ("favorites_based", self._apply_favorites_based_rules)
+            ],
+            key=lambda rule: self.rule_priorities[rule[0]]
+        )
+        
+        # LRU cache of recommendation lists keyed by (user_id, limit, last_active_date)
+        self._rec_cache = OrderedDict()
     
     def get_recommendations(self, user_id, limit=5):
         """
         Generate recommendations for a specific user with updated rule priorities.
+        Results are cached per (user_id, limit, last_active_date), so new activity gets fresh ones.
+        """
+        profile = self.user_profiles.get(user_id)
+        last_active_date = profile["recent_activity"]["last_active_date"] if profile is not None else None
+        key = (user_id, limit, last_active_date)
+        
+        recommendations = self._rec_cache.get(key)
+        if recommendations is None:
+            recommendations = self._compute_recommendations(user_id, limit)
+            self._rec_cache[key] = recommendations
+            if len(self._rec_cache) > self.REC_CACHE_SIZE:
+                self._rec_cache.popitem(last=False)
+        else:
+            self._rec_cache.move_to_end(key)
+        # Return a copy so callers can't modify the cached list
+        return list(recommendations)
+    
+    def invalidate(self, user_id=None):
+        """
+        Drop cached recommendations for one user, or for all users if no user_id is given.
+        """
+        if user_id is None:
+            self._rec_cache.clear()
+        else:
+            for key in [key for key in self._rec_cache if key[0] == user_id]:
+                del self._rec_cache[key]
+    
+    def _compute_recommendations(self, user_id, limit=5):
+        """
+        Run the rule pipeline for a user, without caching.
         """
         # Check if user exists
         if user_id not in self.user_profiles:
             return self._get_fallback_recommendations(limit=limit)
         
-        # Get user profile
+        # Get user profile and the behavior features shared by the rules
         profile = self.user_profiles[user_id]
+        ctx = self._build_context(profile)
         
         # Initialize recommendations with scores for sorting
         all_recommendations = []
+        seen = set()
         
-        # Apply each rule in priority order
-        
-        # 1. View-based rule (highest priority based on correlation)
-        view_recs = self._apply_view_based_rules(profile, limit)
-        all_recommendations.extend(view_recs)
+        # Apply each behavior rule in priority order
+        # (view, preview, recent acquisition, search, cart, favorites)
+        for _, apply_rule in self._rules:
+            self._merge(seen, all_recommendations, apply_rule(profile, ctx, limit))
         
-        # 2. Preview-based rule
-        preview_recs = self._apply_preview_based_rules(profile, limit)
-        all_recommendations.extend([rec for rec in preview_recs if rec["material_id"] not in [r["material_id"] for r in all_recommendations]])
-        
-        # 3. Recent acquisition rule (previously highest priority)
-        acquisition_recs = self._apply_acquisition_based_rules(profile, limit)
-        all_recommendations.extend([rec for rec in acquisition_recs if rec["material_id"] not in [r["material_id"] for r in all_recommendations]])
-        
-        # 4. Search-based rule
-        search_recs = self._apply_search_based_rules(profile, limit)
-        all_recommendations.extend([rec for rec in search_recs if rec["material_id"] not in [r["material_id"] for r in all_recommendations]])
-        
-        # 5. Cart-based rule
-        cart_recs = self._apply_cart_based_rules(profile, limit)
-        all_recommendations.extend([rec for rec in cart_recs if rec["material_id"] not in [r["material_id"] for r in all_recommendations]])
-        
-        # 6. Favorites-based rule (downgraded priority)
-        favorite_recs = self._apply_favorites_based_rules(profile, limit)
-        all_recommendations.extend([rec for rec in favorite_recs if rec["material_id"] not in [r["material_id"] for r in all_recommendations]])
-        
-        # 7. Preference-based rules
+        # Preference-based rules
         if len(all_recommendations) < limit:
-            preference_recs = self._apply_preference_based_rules(profile, limit - len(all_recommendations))
-            all_recommendations.extend([rec for rec in preference_recs if rec["material_id"] not in [r["material_id"] for r in all_recommendations]])
+            preference_recs = self._apply_preference_based_rules(profile, ctx, limit - len(all_recommendations))
+            self._merge(seen, all_recommendations, preference_recs)
         
-        # 8. Fallback rules
+        # Fallback rules
         if len(all_recommendations) < limit:
             fallback_recs = self._get_fallback_recommendations(profile, limit - len(all_recommendations))
-            all_recommendations.extend([rec for rec in fallback_recs if rec["material_id"] not in [r["material_id"] for r in all_recommendations]])
+            self._merge(seen, all_recommendations, fallback_recs)
         
-        # Sort recommendations by rule priority and then by score
-        all_recommendations.sort(key=lambda x: (self.rule_priorities.get(x["rule"], 99), -x.get("score", 0)))
+        # Return the top recommendations by rule priority and then by score
+        rule_priorities = self.rule_priorities
+        return nsmallest(limit, all_recommendations, key=lambda x: (rule_priorities.get(x["rule"], 99), -x.get("score", 0)))
+    
+    @staticmethod
+    def _build_context(profile):
+        """
+        Derive the behavior features read by several rules once per recommendation run.
+        """
+        behavior = profile["behavior"]
+        favorite_ids = [fav["material_id"] for fav in behavior["favorites"]]
+        return {
+            "purchased_ids": {p["material_id"] for p in behavior["purchases"]},
+            "favorite_ids": favorite_ids,
+            "favorite_id_set": set(favorite_ids),
+            # Last 3 searches
+            "recent_searches": nlargest(3, behavior["searches"], key=itemgetter("date")),
+            # Most recent cart addition (the first one on equal dates)
+            "recent_cart": max(
+                (i for i in behavior["interactions"] if i["type"] == "add_to_cart"),
+                key=itemgetter("date"),
+                default=None
+            )
+        }
+    
+    @staticmethod
+    def _merge(seen, dest, recs):
+        """
+        Append recommendations whose material is not in seen yet, updating seen in place.
+        """
+        for rec in recs:
+            material_id = rec["material_id"]
+            if material_id not in seen:
+                seen.add(material_id)
+                dest.append(rec)
+    
+    def _to_rec(self, material, rule, score):
+        """
+        Build a recommendation record for a material from its prebuilt template.
+        """
+        rec = self._rec_templates[material["material_id"]].copy()
+        rec["rule"] = rule
+        rec["score"] = score
+        return rec
+    
+    def _similar_to(self, seed_id, limit, purchased_ids, rule_name, score, max_price_diff=None):
+        """
+        Recommend the top rated materials sharing the seed material's category and grade level,
+        skipping the seed itself and already purchased materials.
+        With max_price_diff, only materials priced within that distance of the seed qualify.
+        """
+        seed = self.data_loader.materials.get(seed_id)
+        if seed is None:
+            return []
+        
+        key = (seed["category"], seed["class_grade"])
+        if max_price_diff is None:
+            # The bucket is sorted by bestseller rating, so the first matches are the top ones
+            similar_materials = islice(
+                (
+                    material for material in self.by_cat_grade.get(key, [])
+                    if material["material_id"] != seed_id and material["material_id"] not in purchased_ids
+                ),
+                limit
+            )
+        else:
+            # Bisect the price-sorted bucket for the window (with a small margin, the exact
+            # check follows), then take the window's top materials in bestseller rating order
+            prices, by_price = self.by_cat_grade_price.get(key, ([], []))
+            seed_price = seed["price"]
+            lo = bisect_left(prices, seed_price - max_price_diff - 1e-9)
+            hi = bisect_right(prices, seed_price + max_price_diff + 1e-9)
+            rating_rank = self._rating_rank
+            similar_materials = nsmallest(
+                limit,
+                (
+                    material for material in by_price[lo:hi]
+                    if material["material_id"] != seed_id and material["material_id"] not in purchased_ids
+                    and abs(material["price"] - seed_price) <= max_price_diff
+                ),
+                key=lambda material: rating_rank[material["material_id"]]
+            )
         
-        return all_recommendations[:limit]
+        return [self._to_rec(material, rule_name, score) for material in similar_materials]
     
-    def _apply_view_based_rules(self, profile, limit=5):
+    def _apply_view_based_rules(self, profile, ctx, limit=5):
         """
         NEW: Apply recommendations based on viewed materials (highest correlation signal).
         """
-        recommendations = []
-        
-        # Check if user has viewed materials
-        if profile["behavior"]["viewed_materials"]:
-            # Get recently viewed material
-            if profile["recent_activity"].get("last_viewed_material"):
-                viewed_material_id = profile["recent_activity"]["last_viewed_material"]
-                
-                if viewed_material_id in self.data_loader.materials:
-                    viewed_material = self.data_loader.materials[viewed_material_id]
-                    
-                    # Find materials with same category and grade level
-                    similar_materials = []
-                    for material in self.material_pool:
-                        if (material["category"] == viewed_material["category"] and 
-                            material["class_grade"] == viewed_material["class_grade"] and 
-                            str(material["material_id"]) != viewed_material_id):
-                            
-                            # Check if not already purchased
-                            purchased_ids = [p["material_id"] for p in profile["behavior"]["purchases"]]
-                            if str(material["material_id"]) not in purchased_ids:
-                                similar_materials.append(material)
-                    
-                    # Sort by bestseller rating
-                    similar_materials.sort(key=lambda x: float(x["bestseller_rating"]), reverse=True)
-                    
-                    # Add recommendations
-                    for material in similar_materials[:limit]:
-                        recommendations.append({
-                            "material_id": str(material["material_id"]),
-                            "title": material["title"],
-                            "category": material["category"],
-                            "class_grade": material["class_grade"],
-                            "price": material["price"],
-                            "bestseller_rating": material["bestseller_rating"],
-                            "is_bundle": material["is_bundle"],
-                            "rule": "view_based",
-                            "score": 5.0  # High base score
-                        })
+        # Check if user has viewed materials and a recently viewed one
+        viewed_material_id = profile["recent_activity"].get("last_viewed_material")
+        if not profile["behavior"]["viewed_materials"] or not viewed_material_id:
+            return []
         
-        return recommendations
+        # High base score
+        return self._similar_to(viewed_material_id, limit, ctx["purchased_ids"], "view_based", 5.0)
     
-    def _apply_preview_based_rules(self, profile, limit=5):
+    def _apply_preview_based_rules(self, profile, ctx, limit=5):
         """
         NEW: Apply recommendations based on previewed materials (second highest correlation).
         """
-        recommendations = []
-        
-        # Check if user has previewed materials
-        if profile["behavior"]["previewed_materials"]:
-            # Get recently previewed material
-            if profile["recent_activity"].get("last_previewed_material"):
-                previewed_material_id = profile["recent_activity"]["last_previewed_material"]
-                
-                if previewed_material_id in self.data_loader.materials:
-                    previewed_material = self.data_loader.materials[previewed_material_id]
-                    
-                    # Find materials with same category and grade level
-                    similar_materials = []
-                    for material in self.material_pool:
-                        if (material["category"] == previewed_material["category"] and 
-                            material["class_grade"] == previewed_material["class_grade"] and 
-                            str(material["material_id"]) != previewed_material_id):
-                            
-                            # Check if not already purchased
-                            purchased_ids = [p["material_id"] for p in profile["behavior"]["purchases"]]
-                            if str(material["material_id"]) not in purchased_ids:
-                                similar_materials.append(material)
-                    
-                    # Sort by bestseller rating
-                    similar_materials.sort(key=lambda x: float(x["bestseller_rating"]), reverse=True)
-                    
-                    # Add recommendations
-                    for material in similar_materials[:limit]:
-                        recommendations.append({
-                            "material_id": str(material["material_id"]),
-                            "title": material["title"],
-                            "category": material["category"],
-                            "class_grade": material["class_grade"],
-                            "price": material["price"],
-                            "bestseller_rating": material["bestseller_rating"],
-                            "is_bundle": material["is_bundle"],
-                            "rule": "preview_based",
-                            "score": 4.5  # High base score
-                        })
+        # Check if user has previewed materials and a recently previewed one
+        previewed_material_id = profile["recent_activity"].get("last_previewed_material")
+        if not profile["behavior"]["previewed_materials"] or not previewed_material_id:
+            return []
         
-        return recommendations
+        # High base score
+        return self._similar_to(previewed_material_id, limit, ctx["purchased_ids"], "preview_based", 4.5)
     
-    def _apply_acquisition_based_rules(self, profile, limit=5):
+    def _apply_acquisition_based_rules(self, profile, ctx, limit=5):
         """
         Previously called _apply_behavior_based_rules, focusing on recent purchases.
         """
-        recommendations = []
-        
-        # Rule: Recent Acquisitions - recommend materials with same grade/subject and similar price
-        if profile["recent_activity"]["last_purchased_material"]:
-            last_material_id = profile["recent_activity"]["last_purchased_material"]
-            if last_material_id in self.data_loader.materials:
-                last_material = self.data_loader.materials[last_material_id]
-                
-                # Find materials with same grade level and category
-                similar_materials = []
-                for material in self.material_pool:
-                    if (material["class_grade"] == last_material["class_grade"] and 
-                        material["category"] == last_material["category"] and 
-                        str(material["material_id"]) != last_material_id):
-                        
-                        # Calculate price similarity (within 2€)
-                        last_price = float(last_material["price"])
-                        current_price = float(material["price"])
-                        if abs(current_price - last_price) <= 2:
-                            similar_materials.append(material)
-                
-                # Sort by bestseller rating
-                similar_materials.sort(key=lambda x: float(x["bestseller_rating"]), reverse=True)
-                
-                # Add recommendations
-                for material in similar_materials[:limit]:
-                    recommendations.append({
-                        "material_id": str(material["material_id"]),
-                        "title": material["title"],
-                        "category": material["category"],
-                        "class_grade": material["class_grade"],
-                        "price": material["price"],
-                        "bestseller_rating": material["bestseller_rating"],
-                        "is_bundle": material["is_bundle"],
-                        "rule": "recent_acquisition",
-                        "score": 4.0  # High but lower than view/preview
-                    })
+        # Rule: Recent Acquisitions - recommend materials with same grade/subject and similar price (within 2€)
+        last_material_id = profile["recent_activity"]["last_purchased_material"]
+        if not last_material_id:
+            return []
         
-        return recommendations
+        # High but lower than view/preview; purchased materials are not filtered out here
+        return self._similar_to(last_material_id, limit, (), "recent_acquisition", 4.0, max_price_diff=2)
     
-    def _apply_search_based_rules(self, profile, limit=5):
+    def _apply_search_based_rules(self, profile, ctx, limit=5):
         """
         NEW: Apply recommendations based on search queries (29% correlation).
         """
         recommendations = []
         
-        # Check if user has search history
-        if profile["behavior"]["searches"]:
-            # Get recent searches (last 3)
-            recent_searches = sorted(
-                profile["behavior"]["searches"],
-                key=lambda x: datetime.strptime(x["date"], "%Y-%m-%d"),
-                reverse=True
-            )[:3]
-            
+        # Check if user has search history (recent searches are the last 3)
+        recent_searches = ctx["recent_searches"]
+        if recent_searches:
             # Extract categories and grades from recent searches
             search_categories = [s["material_category"] for s in recent_searches if "material_category" in s]
             search_grades = [s["class_grade"] for s in recent_searches if "class_grade" in s]
             
-            # Count frequencies
-            category_counts = Counter(search_categories)
-            grade_counts = Counter(search_grades)
-            
             # Get most common category and grade from searches
-            most_common_category = category_counts.most_common(1)[0][0] if category_counts else None
-            most_common_grade = grade_counts.most_common(1)[0][0] if grade_counts else None
+            most_common_category = _most_common(search_categories)
+            most_common_grade = _most_common(search_grades)
             
             if most_common_category and most_common_grade:
-                # Find materials matching search patterns
-                matching_materials = []
-                for material in self.material_pool:
-                    if (material["category"] == most_common_category and 
-                        material["class_grade"] == most_common_grade):
-                        
-                        # Check if not already purchased
-                        purchased_ids = [p["material_id"] for p in profile["behavior"]["purchases"]]
-                        if str(material["material_id"]) not in purchased_ids:
-                            matching_materials.append(material)
-                
-                # Sort by bestseller rating
-                matching_materials.sort(key=lambda x: float(x["bestseller_rating"]), reverse=True)
+                # Find materials matching search patterns that were not purchased yet,
+                # already in bestseller rating order
+                purchased_ids = ctx["purchased_ids"]
+                matching_materials = (
+                    material for material in self.by_cat_grade.get((most_common_category, most_common_grade), [])
+                    if material["material_id"] not in purchased_ids
+                )
                 
                 # Add recommendations
-                for material in matching_materials[:limit]:
-                    recommendations.append({
-                        "material_id": str(material["material_id"]),
-                        "title": material["title"],
-                        "category": material["category"],
-                        "class_grade": material["class_grade"],
-                        "price": material["price"],
-                        "bestseller_rating": material["bestseller_rating"],
-                        "is_bundle": material["is_bundle"],
-                        "rule": "search_based",
-                        "score": 3.5
-                    })
+                for material in islice(matching_materials, limit):
+                    recommendations.append(self._to_rec(material, "search_based", 3.5))
         
         return recommendations
     
-    def _apply_cart_based_rules(self, profile, limit=5):
+    def _apply_cart_based_rules(self, profile, ctx, limit=5):
         """
         NEW: Apply recommendations based on cart additions (20-23% correlation).
         """
         recommendations = []
         
-        # Extract cart additions from interactions
-        cart_interactions = [i for i in profile["behavior"]["interactions"] if i["type"] == "add_to_cart"]
-        
-        if cart_interactions:
-            # Get most recent cart addition
-            recent_cart = sorted(
-                cart_interactions,
-                key=lambda x: datetime.strptime(x["date"], "%Y-%m-%d"),
-                reverse=True
-            )[0]
-            
+        # Get most recent cart addition from interactions
+        recent_cart = ctx["recent_cart"]
+        if recent_cart is not None:
             cart_material_id = recent_cart["material_id"]
-            
-            if cart_material_id in self.data_loader.materials:
-                cart_material = self.data_loader.materials[cart_material_id]
-                
-                # Find materials with same category and grade level
-                similar_materials = []
-                for material in self.material_pool:
-                    if (material["category"] == cart_material["category"] and 
-                        material["class_grade"] == cart_material["class_grade"] and 
-                        str(material["material_id"]) != cart_material_id):
-                        
-                        # Check if not already purchased
-                        purchased_ids = [p["material_id"] for p in profile["behavior"]["purchases"]]
-                        if str(material["material_id"]) not in purchased_ids:
-                            similar_materials.append(material)
-                
-                # Sort by bestseller rating
-                similar_materials.sort(key=lambda x: float(x["bestseller_rating"]), reverse=True)
-                
-                # Add recommendations
-                for material in similar_materials[:limit]:
-                    recommendations.append({
-                        "material_id": str(material["material_id"]),
-                        "title": material["title"],
-                        "category": material["category"],
-                        "class_grade": material["class_grade"],
-                        "price": material["price"],
-                        "bestseller_rating": material["bestseller_rating"],
-                        "is_bundle": material["is_bundle"],
-                        "rule": "cart_based",
-                        "score": 3.0
-                    })
+            recommendations = self._similar_to(cart_material_id, limit, ctx["purchased_ids"], "cart_based", 3.0)
         
         return recommendations
     
-    def _apply_favorites_based_rules(self, profile, limit=5):
+    def _apply_favorites_based_rules(self, profile, ctx, limit=5):
         """
         Apply favorites-based rules with lower priority based on correlation data.
         """
         recommendations = []
         
-        if profile["behavior"]["favorites"]:
-            # Get all favorite material IDs
-            favorite_ids = [fav["material_id"] for fav in profile["behavior"]["favorites"]]
-            
+        # Get all favorite material IDs
+        favorite_ids = ctx["favorite_ids"]
+        if favorite_ids:
             # Get favorite materials details
             favorite_materials = [self.data_loader.materials.get(fav_id) for fav_id in favorite_ids if fav_id in self.data_loader.materials]
             
-            # Count favorite categories and grade levels
-            fav_categories = Counter([m["category"] for m in favorite_materials if m])
-            fav_grades = Counter([m["class_grade"] for m in favorite_materials if m])
-            
-            # Get most common category and grade
-            most_common_category = fav_categories.most_common(1)[0][0] if fav_categories else None
-            most_common_grade = fav_grades.most_common(1)[0][0] if fav_grades else None
+            # Get most common category and grade of the favorites
+            most_common_category = _most_common(m["category"] for m in favorite_materials if m)
+            most_common_grade = _most_common(m["class_grade"] for m in favorite_materials if m)
             
             if most_common_category and most_common_grade:
-                # Find materials with same category and grade
-                similar_materials = []
-                for material in self.material_pool:
-                    if (material["category"] == most_common_category and
-                        material["class_grade"] == most_common_grade and
-                        str(material["material_id"]) not in favorite_ids):
-                        
-                        # Check if not already purchased
-                        purchased_ids = [p["material_id"] for p in profile["behavior"]["purchases"]]
-                        if str(material["material_id"]) not in purchased_ids:
-                            similar_materials.append(material)
-                
-                # Sort by bestseller rating
-                similar_materials.sort(key=lambda x: float(x["bestseller_rating"]), reverse=True)
+                # Find materials with same category and grade that are neither favorited nor purchased,
+                # already in bestseller rating order
+                purchased_ids = ctx["purchased_ids"]
+                favorite_id_set = ctx["favorite_id_set"]
+                similar_materials = (
+                    material for material in self.by_cat_grade.get((most_common_category, most_common_grade), [])
+                    if material["material_id"] not in favorite_id_set and material["material_id"] not in purchased_ids
+                )
                 
                 # Add recommendations
-                for material in similar_materials[:limit]:
-                    recommendations.append({
-                        "material_id": str(material["material_id"]),
-                        "title": material["title"],
-                        "category": material["category"],
-                        "class_grade": material["class_grade"],
-                        "price": material["price"],
-                        "bestseller_rating": material["bestseller_rating"],
-                        "is_bundle": material["is_bundle"],
-                        "rule": "favorites_based",
-                        "score": 2.5  # Lower score due to lower correlation
-                    })
+                for material in islice(similar_materials, limit):
+                    recommendations.append(self._to_rec(material, "favorites_based", 2.5))  # Lower score due to lower correlation
         
         return recommendations
     
-    def _apply_preference_based_rules(self, profile, limit=5):
+    def _apply_preference_based_rules(self, profile, ctx, limit=5):
         """
         Apply preference-based recommendation rules.
         """
@@ -787,74 +708,40 @@ class RecommendationEngine:
         
         # Rule 1: Category and Grade Preference
         if profile["preferred_category"] and profile["preferred_grade"]:
-            matching_materials = []
-            for material in self.material_pool:
-                if (material["category"] == profile["preferred_category"] and
-                    material["class_grade"] == profile["preferred_grade"]):
-                    # Check if this material was already purchased
-                    purchased_ids = [p["material_id"] for p in profile["behavior"]["purchases"]]
-                    if str(material["material_id"]) not in purchased_ids:
-                        matching_materials.append(material)
-            
-            # Sort by bestseller rating
-            matching_materials.sort(key=lambda x: float(x["bestseller_rating"]), reverse=True)
+            # Skip materials that were already purchased; the bucket is in bestseller rating order
+            purchased_ids = ctx["purchased_ids"]
+            matching_materials = (
+                material for material in self.by_cat_grade.get((profile["preferred_category"], profile["preferred_grade"]), [])
+                if material["material_id"] not in purchased_ids
+            )
             
             # Add recommendations
-            for material in matching_materials[:limit]:
-                recommendations.append({
-                    "material_id": str(material["material_id"]),
-                    "title": material["title"],
-                    "category": material["category"],
-                    "class_grade": material["class_grade"],
-                    "price": material["price"],
-                    "bestseller_rating": material["bestseller_rating"],
-                    "is_bundle": material["is_bundle"],
-                    "rule": "category_grade_preference",
-                    "score": 2.0
-                })
+            for material in islice(matching_materials, limit):
+                recommendations.append(self._to_rec(material, "category_grade_preference", 2.0))
         
         # Rule 2: Price Range Preference
         if len(recommendations) < limit and profile["preferred_price_range"]:
-            price_range = profile["preferred_price_range"]
-            min_price, max_price = 0, 0
-            
-            if price_range == "free":
-                min_price, max_price = 0, 0
-            elif price_range == "low":
-                min_price, max_price = 0.01, 3
-            elif price_range == "medium":
-                min_price, max_price = 3.01, 7
-            elif price_range == "high":
-                min_price, max_price = 7.01, float('inf')
+            # Materials in the preferred range, already in bestseller rating order
+            # (an unknown range matches free materials only)
+            range_materials = self.by_price_range.get(profile["preferred_price_range"], self.by_price_range["free"])
             
-            matching_materials = []
-            for material in self.material_pool:
-                price = float(material["price"]) if isinstance(material["price"], (int, float, str)) else 0
-                if min_price <= price <= max_price:
-                    # Prioritize materials matching the preferred grade if available
-                    if profile["preferred_grade"] and material["class_grade"] == profile["preferred_grade"]:
-                        matching_materials.append((material, 2))  # Higher priority
-                    else:
-                        matching_materials.append((material, 1))  # Lower priority
-            
-            # Sort by priority then bestseller rating
-            matching_materials.sort(key=lambda x: (x[1], float(x[0]["bestseller_rating"])), reverse=True)
+            # Prioritize materials matching the preferred grade if available
+            preferred_grade = profile["preferred_grade"]
+            if preferred_grade:
+                matching_materials = chain(
+                    (m for m in range_materials if m["class_grade"] == preferred_grade),
+                    (m for m in range_materials if m["class_grade"] != preferred_grade)
+                )
+            else:
+                matching_materials = iter(range_materials)
             
             # Add recommendations
-            for material, _ in matching_materials[:limit - len(recommendations)]:
+            seen_ids = {r["material_id"] for r in recommendations}
+            for material in islice(matching_materials, limit - len(recommendations)):
                 # Check if already recommended
-                if material["material_id"] not in [r["material_id"] for r in recommendations]:
-                    recommendations.append({
-                        "material_id": str(material["material_id"]),
-                        "title": material["title"],
-                        "category": material["category"],
-                        "class_grade": material["class_grade"],
-                        "price": material["price"],
-                        "bestseller_rating": material["bestseller_rating"],
-                        "is_bundle": material["is_bundle"],
-                        "rule": "price_preference",
-                        "score": 1.5
-                    })
+                if material["material_id"] not in seen_ids:
+                    seen_ids.add(material["material_id"])
+                    recommendations.append(self._to_rec(material, "price_preference", 1.5))
         
         return recommendations
     
@@ -866,47 +753,19 @@ class RecommendationEngine:
         
         # If we have a profile, use its preferred grade level if available
         if profile and profile["preferred_grade"]:
-            # Find popular materials for that grade level
-            grade_materials = [m for m in self.material_pool if m["class_grade"] == profile["preferred_grade"]]
-            # Sort by bestseller rating
-            grade_materials.sort(key=lambda x: float(x["bestseller_rating"]), reverse=True)
-            
-            # Add recommendations
-            for material in grade_materials[:limit]:
-                recommendations.append({
-                    "material_id": str(material["material_id"]),
-                    "title": material["title"],
-                    "category": material["category"],
-                    "class_grade": material["class_grade"],
-                    "price": material["price"],
-                    "bestseller_rating": material["bestseller_rating"],
-                    "is_bundle": material["is_bundle"],
-                    "rule": "popular_by_grade",
-                    "score": 1.0
-                })
+            # Popular materials for that grade level, presorted by bestseller rating
+            for material in self.by_grade.get(profile["preferred_grade"], [])[:limit]:
+                recommendations.append(self._to_rec(material, "popular_by_grade", 1.0))
         
         # If still not enough or no profile provided, return overall most popular
         if len(recommendations) < limit:
-            # Sort all materials by bestseller rating
-            popular_materials = sorted(self.material_pool, 
-                                      key=lambda x: float(x["bestseller_rating"]), 
-                                      reverse=True)
-            
-            # Add recommendations
-            for material in popular_materials[:limit - len(recommendations)]:
+            # Add recommendations from the presorted overall list
+            seen_ids = {r["material_id"] for r in recommendations}
+            for material in self.popular_materials[:limit - len(recommendations)]:
                 # Check if already recommended
-                if material["material_id"] not in [r["material_id"] for r in recommendations]:
-                    recommendations.append({
-                        "material_id": str(material["material_id"]),
-                        "title": material["title"],
-                        "category": material["category"],
-                        "class_grade": material["class_grade"],
-                        "price": material["price"],
-                        "bestseller_rating": material["bestseller_rating"],
-                        "is_bundle": material["is_bundle"],
-                        "rule": "overall_popular",
-                        "score": 0.5
-                    })
+                if material["material_id"] not in seen_ids:
+                    seen_ids.add(material["material_id"])
+                    recommendations.append(self._to_rec(material, "overall_popular", 0.5))
         
         return recommendations
 